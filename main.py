@@ -2,11 +2,17 @@ import sys
 import subprocess
 from pathlib import Path
 from typing import Iterator
+import asyncio
+import hashlib
 import itertools
 import platform
+import queue
+import sqlite3
+import threading
 
 import chromadb
-import ollama
+import httpx
+import numpy as np
 import titles
 from summarize import summarize
 import json
@@ -16,13 +22,106 @@ from PyQt6.QtWidgets import (
     QLineEdit, QPushButton, QListWidget, QListWidgetItem, QProgressBar,
     QLabel)
 from PyQt6.QtGui import QFont
-from PyQt6.QtCore import Qt
-
-def embed_text(text: list[str]) -> list[list[float]]:
-    """Generate embedding for text using Ollama."""
-    return ollama.embed(model="nomic-embed-text", input=text)["embeddings"]
-
-def index_book(book_path: str, progress_callback) -> str:
+from PyQt6.QtCore import Qt, QThread, pyqtSignal
+
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+
+def env_int(name: str, default: int, lo: int, hi: int) -> int:
+    """Read an integer tuning knob from the environment, bounds-checked."""
+    value = int(os.environ.get(name, default))
+    if not lo <= value <= hi:
+        raise ValueError(f"{name} must be between {lo} and {hi}, got {value}")
+    return value
+
+# Rows per collection.add: Chroma's sweet spot is roughly 50-250.
+CHROMA_BATCH = env_int("CHROMA_BATCH", 250, 1, 5000)
+# Texts per Ollama embed request and how many requests run at once.
+EMBED_BATCH = env_int("EMBED_BATCH", 32, 1, 1024)
+EMBED_CONCURRENCY = env_int("EMBED_CONCURRENCY", 4, 1, 64)
+
+# Keep-alive pool settings for the indexing client: TCP/TLS setup is paid
+# once per run rather than per batch, and HTTP/2 lets concurrent batches
+# multiplex over the same connections. The client itself is opened inside
+# index_book so pooled connections never outlive their event loop.
+OLLAMA_LIMITS = httpx.Limits(max_keepalive_connections=40, max_connections=100, keepalive_expiry=30)
+OLLAMA_TIMEOUT = httpx.Timeout(300.0, connect=10.0)
+
+async def embed_text(client: httpx.AsyncClient, text: list[str], sub_batch: int = EMBED_BATCH, concurrency: int = EMBED_CONCURRENCY) -> list[list[float]]:
+    """Generate embeddings for text using Ollama, overlapping concurrent sub-batches.
+
+    Splits the input into sub-batches of `sub_batch` and dispatches up to
+    `concurrency` embed requests at once (bounded by OLLAMA_NUM_PARALLEL on
+    the server side), then reassembles the results in order.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def embed_one(batch):
+        async with sem:
+            resp = await client.post(
+                "/api/embed", json={"model": "nomic-embed-text", "input": list(batch)})
+            resp.raise_for_status()
+            return resp.json()["embeddings"]
+
+    results = await asyncio.gather(
+        *[embed_one(b) for b in itertools.batched(text, sub_batch)])
+    return [e for r in results for e in r]
+
+def embed_query(text: list[str]) -> list[list[float]]:
+    """Embed a single search query over a one-shot synchronous connection."""
+    with httpx.Client(base_url=OLLAMA_HOST, timeout=OLLAMA_TIMEOUT) as client:
+        resp = client.post(
+            "/api/embed", json={"model": "nomic-embed-text", "input": text})
+        resp.raise_for_status()
+        return resp.json()["embeddings"]
+
+class EmbeddingCache:
+    """Persistent paragraph-hash -> embedding store backed by SQLite.
+
+    Kept next to the source book (not inside the Chroma directory), so
+    re-indexing after the database is deleted or the book is edited only
+    pays Ollama for paragraphs whose text actually changed.
+    """
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "create table if not exists embeddings (hash blob primary key, embedding blob)")
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.sha256(text.encode()).digest()
+
+    def get(self, text: str):
+        row = self.conn.execute(
+            "select embedding from embeddings where hash = ?", (self.key(text),)).fetchone()
+        return np.frombuffer(row[0], dtype=np.float32) if row else None
+
+    def put_many(self, texts: list[str], embeddings: list[list[float]]):
+        self.conn.executemany(
+            "insert or replace into embeddings values (?, ?)",
+            [(self.key(t), np.asarray(e, dtype=np.float32).tobytes())
+             for t, e in zip(texts, embeddings)])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def tune_chroma_sqlite(client) -> None:
+    """Best-effort PRAGMA tuning of Chroma's SQLite store for bulk indexing.
+
+    WAL journaling and relaxed syncing cut fsync stalls during the write-heavy
+    index pass. This reaches into private Chroma internals, so any failure
+    (e.g. after a Chroma upgrade) is swallowed and indexing just proceeds
+    with the default settings.
+    """
+    try:
+        sysdb = getattr(client, "_sysdb", None) or client._server._sysdb
+        conn = sysdb._conn_pool.connect()
+        for pragma in ("journal_mode = wal", "synchronous = normal", "temp_store = memory"):
+            conn.execute(f"pragma {pragma}")
+    except Exception:
+        pass
+
+async def index_book(book_path: str, progress_callback) -> str:
     """Index a book and return the database path."""
     progress_callback("Reading book...")
 
@@ -34,31 +133,97 @@ def index_book(book_path: str, progress_callback) -> str:
 
     progress_callback(f"Creating database at {db_path}...")
     client = chromadb.PersistentClient(path=db_path)
+    tune_chroma_sqlite(client)
     collection_name = Path(book_path).stem.replace(" ", "_").replace("-", "_")
     collection = client.create_collection(name=collection_name, get_or_create=True)
-    ids = itertools.count()
-
-    for batch in itertools.batched(titles.iter_chapter_paragraphs(book_path), 256):
-        chapters, texts = zip(*batch)
-        embeddings = embed_text(texts)
-        progress_callback(f"Indexing: {chapters[0]}")
-        collection.add(
-            ids=[str(next(ids)) for _ in chapters],
-            embeddings=embeddings,
-            documents=list(texts),
-            metadatas=[{"chapter": c} for c in chapters])
-
-    summaries = []
-    for chapter, pairs in itertools.islice(itertools.groupby(titles.iter_chapter_paragraphs(book_path), lambda x: x[0]), 1, None):
-        progress_callback(f"Summarizing {chapter}")
-        summaries.append((chapter, summarize('\n'.join([p[1] for p in pairs]))))
+    cache = EmbeddingCache(str(Path(book_path).parent / (Path(book_path).stem + "_embcache.sqlite")))
+    next_id = 0
+
+    # Parse the EPUB once; the paragraphs feed both the embedding loop and
+    # the per-chapter summaries below.
+    chapter_paragraphs = {}
+    for chapter, text in titles.iter_chapter_paragraphs(book_path):
+        chapter_paragraphs.setdefault(chapter, []).append(text)
+
+    # Drain embedded batches to Chroma on a worker thread so HNSW/SQLite
+    # writes overlap with the next batch's embedding requests. The small
+    # maxsize backpressures the embed loop if writes fall behind. A failed
+    # write is recorded and re-raised in the embed loop; after a failure
+    # the thread keeps draining so the producer never blocks on put.
+    write_queue = queue.Queue(maxsize=2)
+    write_errors = []
+
+    def write_batches():
+        while (item := write_queue.get()) is not None:
+            if write_errors:
+                continue
+            try:
+                collection.add(**item)
+            except Exception as e:
+                write_errors.append(e)
+
+    writer = threading.Thread(target=write_batches)
+    writer.start()
+
+    paragraphs = ((c, t) for c, ts in chapter_paragraphs.items() for t in ts)
+    try:
+        async with httpx.AsyncClient(base_url=OLLAMA_HOST, http2=True,
+                                     limits=OLLAMA_LIMITS, timeout=OLLAMA_TIMEOUT) as ollama:
+            for batch in itertools.batched(paragraphs, CHROMA_BATCH):
+                chapters = []
+                texts = []
+                for chapter, text in batch:
+                    chapters.append(chapter)
+                    texts.append(text)
+                # Only paragraphs missing from the cache go to Ollama; fresh
+                # embeddings are written through for the next run.
+                embeddings = [cache.get(t) for t in texts]
+                misses = [i for i, e in enumerate(embeddings) if e is None]
+                if misses:
+                    fresh = await embed_text(ollama, [texts[i] for i in misses])
+                    cache.put_many([texts[i] for i in misses], fresh)
+                    for i, e in zip(misses, fresh):
+                        embeddings[i] = e
+                progress_callback(f"Indexing: {chapters[0]}")
+                batch_ids = [str(i) for i in range(next_id, next_id + len(chapters))]
+                next_id += len(chapters)
+                write_queue.put(dict(
+                    ids=batch_ids,
+                    # fp32 ndarray matches Chroma's HNSW dtype, skipping its own
+                    # list-of-lists conversion and per-float boxing.
+                    embeddings=np.asarray(embeddings, dtype=np.float32),
+                    documents=texts,
+                    metadatas=[{"chapter": c} for c in chapters]))
+                if write_errors:
+                    break
+    finally:
+        # Always unblock and join the writer, even if embedding raised,
+        # so a non-daemon thread is never left waiting on the queue.
+        write_queue.put(None)
+        writer.join()
+        cache.close()
+    if write_errors:
+        raise write_errors[0]
+
+    chapter_texts = [
+        (chapter, '\n'.join(texts))
+        for chapter, texts in itertools.islice(chapter_paragraphs.items(), 1, None)]
+    progress_callback(f"Summarizing {len(chapter_texts)} chapters")
+    sem = asyncio.Semaphore(4)
+
+    async def summarize_one(text):
+        async with sem:
+            return await summarize(text)
+
+    theses = await asyncio.gather(*[summarize_one(t) for _, t in chapter_texts])
+    summaries = [(chapter, t) for (chapter, _), t in zip(chapter_texts, theses)]
 
     collection.modify(metadata={'summaries': json.dumps(summaries), 'book_path': book_path})
     return db_path
 
 def search_collection(collection, query: str, n_results: int = 10) -> list[tuple[str, str, float]]:
     """Search collection and return (chapter, text, similarity) tuples."""
-    query_embedding = embed_text([query])
+    query_embedding = embed_query([query])
     results = collection.query(
         query_embeddings=query_embedding,
         n_results=n_results)
@@ -80,6 +245,12 @@ def create_search_window(db_path: str):
     collection = collections[0]
 
     class SearchWindow(QMainWindow):
+        # Shared per-style fonts; built once here (after the QApplication
+        # exists) rather than per rendered item.
+        HEADER_FONT = QFont("Arial", 14, QFont.Weight.Bold)
+        SUMMARY_FONT = QFont("Arial", 10)
+        PASSAGE_FONT = QFont("Arial", 12)
+
         def __init__(self):
             super().__init__()
             self.system = platform.system()
@@ -121,18 +292,25 @@ def create_search_window(db_path: str):
             self.show_summaries()
 
         def show_summaries(self):
-            self.results.clear()
-            summaries = json.loads(collection.metadata['summaries'])
-            for chapter_name, summary in summaries:
-                header = QListWidgetItem(chapter_name)
-                header.setFont(QFont("Arial", 14, QFont.Weight.Bold))
-                header.setFlags(header.flags() & ~Qt.ItemFlag.ItemIsSelectable)
-                self.results.addItem(header)
-                for s in summary:
-                    summary_item = QListWidgetItem(s.replace("\n", ""))
-                    summary_item.setFont(QFont("Arial", 10))
-                    summary_item.setFlags(summary_item.flags() & ~Qt.ItemFlag.ItemIsSelectable)
-                    self.results.addItem(summary_item)
+            # Suspend repaints while filling the list so Qt lays out once
+            # at the end; re-enable in a finally so a failed render doesn't
+            # leave the widget permanently blank.
+            self.results.setUpdatesEnabled(False)
+            try:
+                self.results.clear()
+                summaries = json.loads(collection.metadata['summaries'])
+                for chapter_name, summary in summaries:
+                    header = QListWidgetItem(chapter_name)
+                    header.setFont(self.HEADER_FONT)
+                    header.setFlags(header.flags() & ~Qt.ItemFlag.ItemIsSelectable)
+                    self.results.addItem(header)
+                    for s in summary:
+                        summary_item = QListWidgetItem(s.replace("\n", ""))
+                        summary_item.setFont(self.SUMMARY_FONT)
+                        summary_item.setFlags(summary_item.flags() & ~Qt.ItemFlag.ItemIsSelectable)
+                        self.results.addItem(summary_item)
+            finally:
+                self.results.setUpdatesEnabled(True)
 
         def perform_search(self):
             query = self.search_input.text().strip()
@@ -142,25 +320,28 @@ def create_search_window(db_path: str):
                 return
 
             results = search_collection(collection, query)
-            self.results.clear()
-
-            grouped = {}
-            for chapter, text, similarity in results:
-                grouped.setdefault(chapter, []).append((text, similarity))
-
-            for chapter, passages in sorted(grouped.items()):
-                header = QListWidgetItem(f"📖 {chapter}")
-                header.setFont(QFont("Arial", 14, QFont.Weight.Bold))
-                header.setFlags(header.flags() & ~Qt.ItemFlag.ItemIsSelectable)
-                self.results.addItem(header)
-
-                for text, similarity in passages:
-                    truncated = text[:300] + ('...' if len(text) > 300 else '')
-                    item = QListWidgetItem(f"  [{similarity:.2%}] {truncated}")
-                    item.setFont(QFont("Arial", 12))
-                    item.setData(Qt.ItemDataRole.UserRole, text[:150])
-                    self.results.addItem(item)
-
+            self.results.setUpdatesEnabled(False)
+            try:
+                self.results.clear()
+
+                grouped = {}
+                for chapter, text, similarity in results:
+                    grouped.setdefault(chapter, []).append((text, similarity))
+
+                for chapter, passages in sorted(grouped.items()):
+                    header = QListWidgetItem(f"📖 {chapter}")
+                    header.setFont(self.HEADER_FONT)
+                    header.setFlags(header.flags() & ~Qt.ItemFlag.ItemIsSelectable)
+                    self.results.addItem(header)
+
+                    for text, similarity in passages:
+                        truncated = text[:300] + ('...' if len(text) > 300 else '')
+                        item = QListWidgetItem(f"  [{similarity:.2%}] {truncated}")
+                        item.setFont(self.PASSAGE_FONT)
+                        item.setData(Qt.ItemDataRole.UserRole, text[:150])
+                        self.results.addItem(item)
+            finally:
+                self.results.setUpdatesEnabled(True)
             self.status.setText(f"Found {len(results)} results")
 
         def open_in_viewer(self, item: QListWidgetItem):
@@ -172,6 +353,19 @@ def create_search_window(db_path: str):
 
 def create_indexing_window(book_path: str):
     """Create and return the indexing window."""
+    class IndexingThread(QThread):
+        progress = pyqtSignal(str)
+        done = pyqtSignal(str)
+        failed = pyqtSignal(str)
+
+        def run(self):
+            # An exception escaping run() would abort the whole process,
+            # so surface failures through a signal instead.
+            try:
+                self.done.emit(asyncio.run(index_book(book_path, self.progress.emit)))
+            except Exception as e:
+                self.failed.emit(f"Indexing failed: {e}")
+
     class IndexingWindow(QMainWindow):
         def __init__(self):
             super().__init__()
@@ -184,22 +378,22 @@ def create_indexing_window(book_path: str):
 
             self.status = QLabel("Starting indexing...")
             layout.addWidget(self.status)
-
             self.show()
-            QApplication.processEvents()
 
-            db_path = index_book(book_path, self.update_status)
-            self.status.setText("Complete! Opening search interface...")
-            QApplication.processEvents()
+            # Run indexing off the GUI thread; progress updates arrive
+            # through the signal so the event loop keeps repainting.
+            self.indexer = IndexingThread()
+            self.indexer.progress.connect(self.status.setText)
+            self.indexer.done.connect(self.open_search)
+            self.indexer.failed.connect(self.status.setText)
+            self.indexer.start()
 
+        def open_search(self, db_path: str):
+            self.status.setText("Complete! Opening search interface...")
             self.search_window = create_search_window(db_path)
             self.search_window.show()
             self.close()
 
-        def update_status(self, msg: str):
-            self.status.setText(msg)
-            QApplication.processEvents()
-
     return IndexingWindow()
 
 def main():
@@ -1,15 +1,24 @@
-from ollama import chat
+from ollama import AsyncClient
 from pydantic import BaseModel
 
 class Summary(BaseModel):
   theses: list[str]
 
-def summarize(text: str):
-    response = chat(
-        model='qwen3:8b',
+client = AsyncClient()
+
+# Long chapters are summarized from their head rather than sent whole. The
+# prompt cap is derived from the context window at a conservative ~2 chars
+# per token, so instruction + chapter + generated response always fit.
+NUM_CTX = 8192
+NUM_PREDICT = 256
+MAX_CHARS = (NUM_CTX - NUM_PREDICT) * 2
+
+async def summarize(text: str):
+    response = await client.chat(
+        model='qwen2.5:3b',
         messages=[{'role': 'user', 'content':
-            f"Summarize the key points from this chapter in at most 3 succinct self contained claims, each a single sentence long.\n\n{text[:-5000]}"
+            f"Summarize the key points from this chapter in at most 3 succinct self contained claims, each a single sentence long.\n\n{text[:MAX_CHARS]}"
         }],
         format=Summary.model_json_schema(),
-        options={'temperature': 0})
+        options={'temperature': 0, 'num_ctx': NUM_CTX, 'num_predict': NUM_PREDICT})
     return Summary.model_validate_json(response.message.content).theses
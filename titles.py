@@ -1,6 +1,7 @@
 import zipfile
 import xml.etree.ElementTree as ET
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 import itertools
 
 def iter_chapter_paragraphs(epub_path):
@@ -48,16 +49,21 @@ def iter_chapter_paragraphs_(epub_path):
 
             chapters.append((title, full_path))
 
-        # 3. For each chapter, extract <p> paragraphs
-        for chapter_title, chapter_file in chapters:
-            if chapter_file not in z.namelist():
-                continue  # skip missing files
+        # 3. For each chapter, extract <p> paragraphs. Decompression and
+        # parsing happen on a thread pool (zlib and lxml release the GIL)
+        # while results are yielded in the original chapter order.
+        def parse_chapter(chapter_file):
+            soup = BeautifulSoup(z.read(chapter_file), "lxml")
+            return [
+                text for p in soup.find_all("p")
+                if (text := p.get_text(strip=True, separator=" "))]
 
-            html = z.read(chapter_file)
-            soup = BeautifulSoup(html, "html.parser")
-
-            # Get all paragraph tags
-            for p in soup.find_all("p"):
-                text = p.get_text(strip=True, separator=" ")
-                if text:
+        names = set(z.namelist())
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [
+                (title, pool.submit(parse_chapter, chapter_file))
+                for title, chapter_file in chapters
+                if chapter_file in names]  # skip missing files
+            for chapter_title, future in futures:
+                for text in future.result():
                     yield (chapter_title, text)